@@ -261,4 +261,16 @@ def delete_preconditions(graph: Graph) -> None:
     query1 = """MATCH (effect)-[r:CONSTRAINED_BY]->(precondition) DELETE r"""
     query2 = """MATCH (n:Precondition) DETACH DELETE n"""
     graph.run(query1)
-    graph.run(query2)
\ No newline at end of file
+    graph.run(query2)
+
+def get_effect_preconditions(graph: Graph) -> list[tuple]:
+    # 读取完整的Space-Device-Action-Effect-CONSTRAINED_BY-Precondition模型，没有precondition的effect返回空列表
+    query = """
+    MATCH (space:Space)<-[:BELONG_TO]-(device:Device)-[:CAN]->(action:Action)-[:HAS]->(effect:Effect)
+    OPTIONAL MATCH (effect)-[:CONSTRAINED_BY]->(precondition:Precondition)
+    RETURN space.name AS space, device.name AS device, action.name AS action, effect.name AS effect,
+           collect(precondition.name) AS preconditions
+    """
+    result = graph.run(query)
+    return [(record['space'], record['device'], record['action'], record['effect'], record['preconditions'])
+            for record in result]
@@ -13,89 +13,127 @@ context_mapping = {
     "Lab": ["Lab", "Corridor"]
 }
 
-def get_counterexamples(log_path, save_path, initial_states, graph):
+def replay_actions(log_path, initial_states, graph):
+    # 逐条回放log，根据event实时更新环境信息；对每个action（Door除外）返回当时的环境和之后5分钟内观察到的effect
     excel_files = sorted(
     [f for f in os.listdir(log_path) if f.endswith('.xlsx') and any(f.startswith(f'day_{i:02}') for i in range(1, 29))],
     key=lambda x: int(x.split('_')[1].split('.')[0])
 )
-    
+
+    for file in excel_files:
+        file_path = os.path.join(log_path, file)
+        df = pd.read_excel(file_path, engine='openpyxl')
+        for index, row in df.iterrows():
+            if row['Type'] == 'Event':
+                # 根据event实时更新环境信息
+                event_space = row['Location']
+                attr = row['Object']
+                value = row['Payload Data'].split(':')[1].strip()
+                initial_states[event_space]['state'][attr] = value
+            elif row['Type'] == 'Action':
+                if 'on' in row['Name']:
+                    initial_states[row['Location']]['device'][row['Object']] = '1'
+                elif 'off' in row['Name']:
+                    initial_states[row['Location']]['device'][row['Object']] = '0'
+                if row['Object'] != 'Door':
+                    effects = []
+                    action_space = row['Location']
+                    device = row['Object']
+                    action = 'action_on' if 'on' in row['Name'] else 'action_off'
+                    # 用graph查询找到对应space的对应device的对应action的effect
+                    query = f"""
+                    MATCH (space:Space {{name: "{action_space}"}})<-[:BELONG_TO]-(device:Device)-[:CAN]->(action:Action {{name: "{action}"}})-[:HAS]->(effect:Effect)
+                    WHERE device.name =~ "{device}.*"
+                    RETURN effect
+                    """
+
+                    tx = graph.begin()  # 手动开始事务
+                    try:
+                        result = tx.run(query, action_space=action_space, device=device, action=action)
+                        for record in result:
+                            effect_node = record['effect']['name']
+                            effects.append(effect_node)
+                        tx.commit()  # 提交事务
+                    except Exception as e:
+                        tx.rollback()  # 回滚事务
+                        raise e
+
+                    # 检查接下来5分钟的event log，记录观察到的effect和其他状态变化
+                    logs = []
+                    observed = []
+                    action_time = datetime.strptime(row['Timestamp'], "%Y-%m-%d %H:%M:%S")
+                    for i in range(index+1, len(df)):
+                        log_time = datetime.strptime(df.loc[i, 'Timestamp'], "%Y-%m-%d %H:%M:%S")
+                        time_delta = log_time - action_time
+                        if df.loc[i, 'Type'] == 'Event' and df.loc[i, 'Location'] == action_space and time_delta <= timedelta(minutes=5):
+                            name = df.loc[i, 'Name'].strip().lower()
+                            if any(name in element.lower() for element in effects):
+                                observed.append(name)
+                            else:
+                                logs.append(str(df.loc[i, 'Object'])+", "+str(df.loc[i, 'Name'])+", "+str(df.loc[i, 'Payload Data']))
+                        if time_delta > timedelta(minutes=5):
+                            break
+                    # 根据action_space，只保留联通部分的context的state
+                    temp_keys = context_mapping[action_space]
+                    specific_context = {key: copy.deepcopy(initial_states[key]) for key in temp_keys}
+                    yield {
+                        "Space": action_space,
+                        "Context": specific_context,
+                        "Device": device,
+                        "Action": action,
+                        "Effects": effects,
+                        "Observed": observed,
+                        "LogRecords": logs
+                    }
+
+def get_counterexamples(log_path, save_path, initial_states, graph):
     counterexamples = []
     with open(save_path, 'w') as f:  # 打开jsonl文件
-        for file in excel_files:
-            file_path = os.path.join(log_path, file)
-            df = pd.read_excel(file_path, engine='openpyxl')
-            for index, row in df.iterrows():
-                if row['Type'] == 'Event':
-                    # 根据event实时更新环境信息
-                    event_space = row['Location']
-                    attr = row['Object']
-                    value = row['Payload Data'].split(':')[1].strip()
-                    initial_states[event_space]['state'][attr] = value
-                elif row['Type'] == 'Action':
-                    if 'on' in row['Name']:
-                        initial_states[row['Location']]['device'][row['Object']] = '1'
-                    elif 'off' in row['Name']:
-                        initial_states[row['Location']]['device'][row['Object']] = '0'
-                    if row['Object'] != 'Door':
-                        effects = []
-                        # 对每个action，检查后续是否有对应的effect生效，没有生效的就是反例
-                        action_space = row['Location']
-                        device = row['Object']
-                        action = 'action_on' if 'on' in row['Name'] else 'action_off'
-                        # 用graph查询找到对应space的对应device的对应action的effect
-                        query = f"""
-                        MATCH (space:Space {{name: "{action_space}"}})<-[:BELONG_TO]-(device:Device)-[:CAN]->(action:Action {{name: "{action}"}})-[:HAS]->(effect:Effect)
-                        WHERE device.name =~ "{device}.*"
-                        RETURN effect
-                        """
+        for record in replay_actions(log_path, initial_states, graph):
+            # 对每个action，检查后续是否有对应的effect生效，没有生效的就是反例
+            if record['Observed']:
+                continue
+            for effect in record['Effects']:
+                if 'energy' in effect:
+                    # 跳过energy consumption相关的effect
+                    continue
+                # 构建大字典方便直接被ChatPromptTemplate调用
+                counterexample = {
+                    "Space": record['Space'],
+                    "Context": copy.deepcopy(record['Context']),
+                    "Device": record['Device'],
+                    "Action": record['Action'],
+                    "Effect": effect,
+                    "LogRecords": record['LogRecords']
+                }
+                counterexamples.append(counterexample)
+                f.write(json.dumps(counterexample) + '\n')  # 每找到一个反例就写入一次文件
 
-                        tx = graph.begin()  # 手动开始事务
-                        try:
-                            result = tx.run(query, action_space=action_space, device=device, action=action)
-                            for record in result:
-                                effect_node = record['effect']['name']
-                                effects.append(effect_node)
-                            tx.commit()  # 提交事务
-                        except Exception as e:
-                            tx.rollback()  # 回滚事务
-                            raise e
-                        
-                        # 检查接下来5分钟的event log，判断是否有对应的effect生效
-                        logs = []
-                        action_time = datetime.strptime(row['Timestamp'], "%Y-%m-%d %H:%M:%S")
-                        effect_active = False
-                        for i in range(index+1, len(df)):
-                            log_time = datetime.strptime(df.loc[i, 'Timestamp'], "%Y-%m-%d %H:%M:%S")
-                            time_delta = log_time - action_time
-                            if df.loc[i, 'Type'] == 'Event' and df.loc[i, 'Location'] == action_space and time_delta <= timedelta(minutes=5):
-                                if any(df.loc[i, 'Name'].strip().lower() in element.lower() for element in effects):
-                                    effect_active = True
-                                    break
-                                else:
-                                    logs.append(str(df.loc[i, 'Object'])+", "+str(df.loc[i, 'Name'])+", "+str(df.loc[i, 'Payload Data']))
-                            if time_delta > timedelta(minutes=5):
-                                break
-                        if not effect_active:
-                            for effect in effects:
-                                if 'energy' in effect:
-                                    # 跳过energy consumption相关的effect
-                                    continue
-                                # 根据action_space，只保留联通部分的context的state，构建大字典方便直接被ChatPromptTemplate调用
-                                temp_keys = context_mapping[action_space]
-                                specific_context = {key: copy.deepcopy(initial_states[key]) for key in temp_keys}
-                                counterexample = {
-                                    "Space": action_space,
-                                    "Context": specific_context,
-                                    "Device": device,
-                                    "Action": action,
-                                    "Effect": effect,
-                                    "LogRecords": logs
-                                }
-                                counterexamples.append(counterexample)
-                                f.write(json.dumps(counterexample) + '\n')  # 每找到一个反例就写入一次文件
-    
     return counterexamples
 
+def get_action_outcomes(log_path, save_path, initial_states, graph):
+    # 回放整个log，每个action实例的每个effect输出一行，Occurred表示该effect在5分钟内是否生效
+    # 和get_counterexamples不同，这里逐个effect判断是否生效，供rule_index.RuleIndex.score使用
+    outcomes = []
+    with open(save_path, 'w') as f:
+        for record in replay_actions(log_path, initial_states, graph):
+            for effect in record['Effects']:
+                if 'energy' in effect:
+                    # 跳过energy consumption相关的effect
+                    continue
+                outcome = {
+                    "Space": record['Space'],
+                    "Context": record['Context'],
+                    "Device": record['Device'],
+                    "Action": record['Action'],
+                    "Effect": effect,
+                    "Occurred": any(name in effect.lower() for name in record['Observed'])
+                }
+                outcomes.append(outcome)
+                f.write(json.dumps(outcome) + '\n')
+
+    return outcomes
+
 if __name__ == "__main__":
     import json
 
@@ -0,0 +1,236 @@
+import re
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# precondition里出现的非数值状态值（如Weather: sunny）从这里开始编码，避免和-1/0/1冲突
+STRING_VALUE_BASE = 1 << 20
+# 环境中缺失的状态，不会和任何predicate相等
+MISSING = np.iinfo(np.int64).min
+INT64_MIN, INT64_MAX = int(np.iinfo(np.int64).min), int(np.iinfo(np.int64).max)
+
+# 单条rule：在(space, device, action)下期望产生effect，任一precondition成立时effect被抑制
+# precondition为原始字符串，clauses为编码后的[(列号, 值), ...]合取式
+Rule = namedtuple("Rule", ["space", "device", "action", "effect", "precondition", "clauses"])
+Verdict = namedtuple("Verdict", ["expected", "suppressed"])
+
+
+def parse_precondition(precondition: str, space: str) -> list[tuple]:
+    # "Noise, -1" -> [("Lab", "Noise", "-1")]
+    # "Humidity, 1), (WaterDispenser, 0" -> 两个predicate的合取
+    # "MeetingRoomOne.Humidity, 1" -> 指定了space的predicate
+    predicates = []
+    for part in re.split(r'\)\s*,\s*\(', precondition):
+        part = part.strip().strip('()').strip()
+        if ',' not in part:
+            raise ValueError(f"Invalid precondition: {precondition}")
+        name, value = [s.strip() for s in part.rsplit(',', 1)]
+        if not name or not value:
+            raise ValueError(f"Invalid precondition: {precondition}")
+        pred_space = space
+        if '.' in name:
+            pred_space, name = name.split('.', 1)
+        predicates.append((pred_space, name, value))
+    return predicates
+
+
+class RuleIndex():
+    def __init__(self):
+        self.columns = {}   # "Space.Name" -> 列号
+        self.values = {}    # 非数值状态值 -> 编码
+        self.rules = []
+        # (space, device, action) -> [(effect, [(precondition, clauses), ...]), ...]
+        self.index = {}
+
+    def encode_value(self, value, insert: bool = True) -> int:
+        # 查询时insert=False，没有predicate用到的非数值状态值编码为MISSING，不会修改编码表
+        value = str(value).strip()
+        number = None
+        try:
+            number = int(value)
+        except ValueError:
+            # 经过pandas或json后状态值可能变成1.0这样的浮点数
+            try:
+                number = float(value)
+                number = int(number) if number.is_integer() else None
+            except (ValueError, OverflowError):
+                number = None
+        # 超出int64范围的整数按字符串处理，避免写入编码矩阵时溢出
+        if number is not None and INT64_MIN < number <= INT64_MAX:
+            return number
+        if value not in self.values:
+            if not insert:
+                return MISSING
+            self.values[value] = STRING_VALUE_BASE + len(self.values)
+        return self.values[value]
+
+    def _column(self, space: str, name: str) -> int:
+        key = f"{space}.{name}"
+        if key not in self.columns:
+            self.columns[key] = len(self.columns)
+        return self.columns[key]
+
+    def add_effect(self, space: str, device: str, action: str, effect: str) -> list:
+        device = re.sub(r'\d+$', '', device)
+        effects = self.index.setdefault((space, device, action), [])
+        for name, preconditions in effects:
+            if name == effect:
+                return preconditions
+        preconditions = []
+        effects.append((effect, preconditions))
+        return preconditions
+
+    def add_rule(self, space: str, device: str, action: str, effect: str, precondition: str) -> Rule:
+        predicates = parse_precondition(precondition, space)
+        device = re.sub(r'\d+$', '', device)
+        preconditions = self.add_effect(space, device, action, effect)
+        # clauses排序后比较：Light1和Light2去掉编号后是同一个device，
+        # "Humidity, 1), (WaterDispenser, 0"和"WaterDispenser, 0), (Humidity, 1"也是同一条precondition，只保留第一次出现的
+        clauses = tuple(sorted((self._column(s, n), self.encode_value(v)) for s, n, v in predicates))
+        for p, existing in preconditions:
+            if existing == clauses:
+                return Rule(space, device, action, effect, p, clauses)
+        preconditions.append((precondition, clauses))
+        rule = Rule(space, device, action, effect, precondition, clauses)
+        self.rules.append(rule)
+        return rule
+
+    def _add_rules(self, rows, logger=None) -> None:
+        for space, device, action, effect, precondition in rows:
+            try:
+                self.add_rule(space, device, action, effect, precondition)
+            except ValueError as e:
+                if logger is not None:
+                    logger.warning(f"Skip {space}, {device}, {action}, {effect}: {e}")
+
+    @classmethod
+    def from_graph(cls, graph, logger=None) -> "RuleIndex":
+        from db import get_effect_preconditions
+
+        rule_index = cls()
+        rows = []
+        for space, device, action, effect, preconditions in get_effect_preconditions(graph):
+            rule_index.add_effect(space, device, action, effect)
+            rows.extend((space, device, action, effect, p) for p in preconditions)
+        rule_index._add_rules(rows, logger)
+        return rule_index
+
+    @classmethod
+    def from_csv(cls, path: str, effects=None, logger=None) -> "RuleIndex":
+        # effects为(space, device, action, effect)的effect model
+        # 给出effects时和db.add_precondition_node一致：csv的每一行按(device, action, effect)匹配，
+        # 挂到所有space中对应的effect上，未指定space的状态按该effect所在的space解析
+        # 没有给出时只按csv行自己的space索引csv中出现的effect，此时和from_graph得到的rule表不等价
+        rule_index = cls()
+        df = pd.read_csv(path)
+        rows = df[['space', 'device', 'action', 'effect', 'precondition']].itertuples(index=False)
+        if effects is None:
+            rule_index._add_rules(rows, logger)
+            return rule_index
+
+        spaces = {}
+        for space, device, action, effect in effects:
+            device = re.sub(r'\d+$', '', device)
+            rule_index.add_effect(space, device, action, effect)
+            spaces.setdefault((device, action, effect), []).append(space)
+        matched = []
+        for _, device, action, effect, precondition in rows:
+            for space in spaces.get((device, action, effect), []):
+                matched.append((space, device, action, effect, precondition))
+        rule_index._add_rules(matched, logger)
+        return rule_index
+
+    def encode_state(self, states: dict) -> list[int]:
+        # states的格式和initial_environment_state.json一致：{space: {'device': {...}, 'state': {...}}}
+        encoded = [MISSING] * len(self.columns)
+        for space, groups in states.items():
+            for group in ('device', 'state'):
+                for name, value in groups.get(group, {}).items():
+                    col = self.columns.get(f"{space}.{name}")
+                    if col is not None:
+                        encoded[col] = self.encode_value(value, insert=False)
+        return encoded
+
+    def evaluate(self, space: str, device: str, action: str, state) -> Verdict:
+        # state可以是encode_state的结果，也可以是原始的环境字典
+        # 编码后的state在添加新rule后需要重新编码，列数不一致时报错
+        if isinstance(state, dict):
+            state = self.encode_state(state)
+        elif len(state) != len(self.columns):
+            raise ValueError(f"Encoded state has {len(state)} columns, expected {len(self.columns)}; re-encode it after adding rules")
+        expected, suppressed = [], {}
+        for effect, preconditions in self.index.get((space, re.sub(r'\d+$', '', device), action), ()):
+            fired = [p for p, clauses in preconditions if all(state[c] == v for c, v in clauses)]
+            if fired:
+                suppressed[effect] = fired
+            else:
+                expected.append(effect)
+        return Verdict(expected, suppressed)
+
+    def encode_states(self, contexts) -> np.ndarray:
+        matrix = np.full((len(contexts), len(self.columns)), MISSING, dtype=np.int64)
+        for i, context in enumerate(contexts):
+            matrix[i] = self.encode_state(context)
+        return matrix
+
+    def score(self, df: pd.DataFrame) -> pd.DataFrame:
+        # df为回放整个log得到的action实例（log_analyze.get_action_outcomes的输出格式），
+        # 每行包含Space, Device, Action, Effect, Context和Occurred（该effect是否生效）
+        # 没有Occurred列时（如get_counterexamples的反例）所有行都视为effect未生效，此时support和failures相同
+        # support: precondition成立的实例数
+        # failures: precondition成立且effect未生效的实例数，即该precondition能解释的反例数
+        # coverage: failures / 该effect未生效的实例总数
+        # confidence: failures / support，一直成立的状态（如Lab的窗户一直开着）在effect生效时也成立，confidence会偏低
+        columns = ['space', 'device', 'action', 'effect', 'precondition', 'support', 'failures', 'coverage', 'confidence']
+        if not self.rules:
+            return pd.DataFrame(columns=columns)
+        matrix = self.encode_states(list(df['Context']))
+        effect_keys = {}
+        keys = np.array([effect_keys.setdefault((s, re.sub(r'\d+$', '', d), a, e), len(effect_keys))
+                         for s, d, a, e in zip(df['Space'], df['Device'], df['Action'], df['Effect'])], dtype=np.int64)
+        if 'Occurred' in df:
+            failed = ~df['Occurred'].to_numpy(dtype=bool)
+        else:
+            failed = np.ones(len(df), dtype=bool)
+        total_failures = np.bincount(keys[failed], minlength=len(effect_keys))
+
+        # 相同的precondition只计算一次mask，再按effect分组计数
+        counts = {}
+        for rule in self.rules:
+            if rule.clauses not in counts:
+                mask = np.ones(len(df), dtype=bool)
+                for col, value in rule.clauses:
+                    mask &= matrix[:, col] == value
+                counts[rule.clauses] = (np.bincount(keys[mask], minlength=len(effect_keys)),
+                                        np.bincount(keys[mask & failed], minlength=len(effect_keys)))
+
+        rows = []
+        for rule in self.rules:
+            key = effect_keys.get((rule.space, rule.device, rule.action, rule.effect))
+            if key is None:
+                support, failures, total = 0, 0, 0
+            else:
+                support = int(counts[rule.clauses][0][key])
+                failures = int(counts[rule.clauses][1][key])
+                total = int(total_failures[key])
+            rows.append(list(rule[:5]) + [support, failures,
+                                          failures / total if total else 0.0,
+                                          failures / support if support else 0.0])
+        return pd.DataFrame(rows, columns=columns)
+
+
+if __name__ == "__main__":
+    import os
+    import json
+
+    rule_index = RuleIndex.from_csv("data/precondition_unique.csv")
+    state = {"Lab": {"device": {"Window": "1", "AirPurifier": "1"}, "state": {"AirQuality": "0", "Humidity": "1"}}}
+    print(rule_index.evaluate("Lab", "Humidifier", "action_on", state))
+
+    # action_outcomes.jsonl由log_analyze.get_action_outcomes生成，不在仓库里
+    save_path = "data/action_outcomes.jsonl"
+    if os.path.exists(save_path):
+        with open(save_path, 'r') as file:
+            data = [json.loads(line) for line in file]
+        print(rule_index.score(pd.DataFrame(data)))
@@ -0,0 +1,198 @@
+import os
+
+import pandas as pd
+import pytest
+
+from rule_index import MISSING, RuleIndex, parse_precondition
+
+CSV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "precondition_unique.csv")
+
+
+@pytest.fixture(scope="module")
+def rule_index():
+    return RuleIndex.from_csv(CSV_PATH)
+
+
+def test_parse_precondition():
+    assert parse_precondition("Noise, -1", "Corridor") == [("Corridor", "Noise", "-1")]
+    assert parse_precondition("Humidity, 1), (WaterDispenser, 0", "TeaRoom") == [
+        ("TeaRoom", "Humidity", "1"), ("TeaRoom", "WaterDispenser", "0")]
+    assert parse_precondition("MeetingRoomOne.Temperature, -1), (MeetingRoomOne.AC, 1", "TeaRoom") == [
+        ("MeetingRoomOne", "Temperature", "-1"), ("MeetingRoomOne", "AC", "1")]
+    with pytest.raises(ValueError):
+        parse_precondition("##DON'T KNOW##", "Lab")
+
+
+def test_encode_value():
+    index = RuleIndex()
+    assert index.encode_value("-1") == -1
+    assert index.encode_value(1.0) == 1
+    assert index.encode_value("1.0") == 1
+    code = index.encode_value("sunny")
+    assert index.encode_value("sunny", insert=False) == code
+    assert index.encode_value("rainy", insert=False) == MISSING
+    assert "rainy" not in index.values
+    # 超出int64范围的整数按字符串处理
+    assert index.encode_value("99999999999999999999", insert=False) == MISSING
+    assert index.encode_states([{"Lab": {"state": {"Noise": "99999999999999999999"}}}]).shape == (1, 0)
+
+
+def test_encode_state_missing(rule_index):
+    encoded = rule_index.encode_state({"Lab": {"state": {"Noise": "rainy", "Humidity": 1.0}, "device": {}}})
+    assert encoded[rule_index.columns["Lab.Humidity"]] == 1
+    assert encoded[rule_index.columns["Lab.Noise"]] == MISSING
+    assert encoded[rule_index.columns["Corridor.Noise"]] == MISSING
+
+
+def test_evaluate_rejects_stale_state():
+    index = RuleIndex()
+    index.add_rule("Lab", "AC", "action_on", "effect_temperature_down", "Temperature, -1")
+    encoded = index.encode_state({"Lab": {"state": {"Temperature": "-1", "Noise": "99999999999999999999"}}})
+    assert index.evaluate("Lab", "AC", "action_on", encoded).suppressed == {"effect_temperature_down": ["Temperature, -1"]}
+    index.add_rule("Lab", "AC", "action_on", "effect_noise_up", "Noise, 1")
+    with pytest.raises(ValueError):
+        index.evaluate("Lab", "AC", "action_on", encoded)
+    matrix = index.encode_states([{"Lab": {"state": {"Noise": "99999999999999999999"}}}])
+    assert matrix[0, index.columns["Lab.Noise"]] == MISSING
+
+
+def test_evaluate_conjunction(rule_index):
+    state = {"TeaRoom": {"device": {"WaterDispenser": "0"}, "state": {"Humidity": "1"}}}
+    verdict = rule_index.evaluate("TeaRoom", "WaterDispenser", "action_off", state)
+    assert "effect_humidity_up" not in verdict.expected
+    # 两种顺序的合取式只保留一条
+    assert sorted(verdict.suppressed["effect_humidity_up"]) == ["Humidity, 1", "Humidity, 1), (WaterDispenser, 0"]
+
+    state["TeaRoom"]["device"]["WaterDispenser"] = "1"
+    verdict = rule_index.evaluate("TeaRoom", "WaterDispenser", "action_off", state)
+    assert verdict.suppressed["effect_humidity_up"] == ["Humidity, 1"]
+
+
+def test_evaluate_qualified_space(rule_index):
+    precondition = "MeetingRoomOne.Temperature, -1), (MeetingRoomOne.AC, 1"
+    state = {"MeetingRoomOne": {"device": {"AC": "1"}, "state": {"Temperature": "-1"}},
+             "TeaRoom": {"device": {"Humidifier": "0"}, "state": {}}}
+    verdict = rule_index.evaluate("TeaRoom", "Window", "action_off", state)
+    assert verdict.suppressed["effect_temperature_up"] == [precondition]
+
+    # 状态在TeaRoom而不是MeetingRoomOne时不成立
+    state = {"TeaRoom": {"device": {"AC": "1", "Humidifier": "0"}, "state": {"Temperature": "-1"}}}
+    verdict = rule_index.evaluate("TeaRoom", "Window", "action_off", state)
+    assert "effect_temperature_up" in verdict.expected
+
+
+def test_from_csv_with_effects_applies_across_spaces():
+    effects = [("Lab", "AC1", "action_on", "effect_temperature_down"),
+               ("MeetingRoomOne", "AC", "action_on", "effect_temperature_down"),
+               ("MeetingRoomOne", "AC", "action_on", "effect_noise_up")]
+    index = RuleIndex.from_csv(CSV_PATH, effects)
+    verdict = index.evaluate("MeetingRoomOne", "AC", "action_on", {"MeetingRoomOne": {"state": {"Temperature": "-1"}}})
+    assert verdict.suppressed == {"effect_temperature_down": ["Temperature, -1"]}
+    assert verdict.expected == ["effect_noise_up"]
+
+
+def test_add_rule_deduplicates_devices():
+    index = RuleIndex()
+    index.add_rule("Lab", "Light1", "action_on", "effect_brightness_up", "Brightness, 1")
+    index.add_rule("Lab", "Light2", "action_on", "effect_brightness_up", "Brightness, 1")
+    assert len(index.rules) == 1
+    verdict = index.evaluate("Lab", "Light", "action_on", {"Lab": {"state": {"Brightness": "1"}}})
+    assert verdict.suppressed == {"effect_brightness_up": ["Brightness, 1"]}
+
+
+class StubGraph():
+    def __init__(self, records):
+        self.records = records
+
+    def run(self, query, **kwargs):
+        return self.records
+
+
+def test_from_graph():
+    pytest.importorskip("db")
+    graph = StubGraph([
+        {"space": "Lab", "device": "Light1", "action": "action_on", "effect": "effect_brightness_up",
+         "preconditions": ["Brightness, 1"]},
+        {"space": "Lab", "device": "Light2", "action": "action_on", "effect": "effect_brightness_up",
+         "preconditions": ["Brightness, 1"]},
+        {"space": "Lab", "device": "Light1", "action": "action_on", "effect": "effect_temperature_up",
+         "preconditions": []},
+        {"space": "Lab", "device": "AC", "action": "action_on", "effect": "effect_noise_up",
+         "preconditions": ["##DON'T KNOW##"]},
+    ])
+    warnings = []
+    logger = type("Logger", (), {"warning": lambda self, msg: warnings.append(msg)})()
+    index = RuleIndex.from_graph(graph, logger)
+
+    assert len(index.rules) == 1
+    verdict = index.evaluate("Lab", "Light2", "action_on", {"Lab": {"state": {"Brightness": "1"}}})
+    assert verdict.suppressed == {"effect_brightness_up": ["Brightness, 1"]}
+    assert verdict.expected == ["effect_temperature_up"]
+    # 无法解析的precondition被跳过并记录，effect本身仍然是expected
+    assert index.evaluate("Lab", "AC", "action_on", {}).expected == ["effect_noise_up"]
+    assert len(warnings) == 1 and "##DON'T KNOW##" in warnings[0]
+
+
+def outcome(space, device, action, effect, context, occurred):
+    return {"Space": space, "Device": device, "Action": action, "Effect": effect, "Context": context, "Occurred": occurred}
+
+
+def test_score(rule_index):
+    lab = {"Lab": {"device": {"Window": "1", "AirPurifier": "1"}, "state": {"AirQuality": "0"}}}
+    lab_good_air = {"Lab": {"device": {"Window": "1", "AirPurifier": "1"}, "state": {"AirQuality": "-1"}}}
+    df = pd.DataFrame([
+        outcome("Corridor", "Speaker", "action_off", "effect_noise_down", {"Corridor": {"state": {"Noise": "-1"}}}, False),
+        outcome("Corridor", "Speaker", "action_off", "effect_noise_down", {"Corridor": {"state": {"Noise": "-1"}}}, False),
+        outcome("Corridor", "Speaker", "action_off", "effect_noise_down", {"Corridor": {"state": {"Noise": "0"}}}, False),
+        outcome("Corridor", "Speaker", "action_off", "effect_noise_down", {"Corridor": {"state": {"Noise": "1"}}}, True),
+        # Lab的窗户一直开着，effect生效和未生效时Window, 1都成立
+        outcome("Lab", "AC", "action_on", "effect_airquality_up", lab, False),
+        outcome("Lab", "AC", "action_on", "effect_airquality_up", lab, False),
+        outcome("Lab", "AC", "action_on", "effect_airquality_up", lab_good_air, True),
+        outcome("Lab", "AC", "action_on", "effect_airquality_up", lab_good_air, True),
+    ])
+    scores = rule_index.score(df).set_index(["space", "device", "action", "effect", "precondition"]).sort_index()
+    assert len(scores) == len(rule_index.rules)
+
+    noise = scores.loc[("Corridor", "Speaker", "action_off", "effect_noise_down", "Noise, -1")]
+    assert noise["support"] == 2
+    assert noise["failures"] == 2
+    assert noise["coverage"] == pytest.approx(2 / 3)
+    assert noise["confidence"] == 1.0
+
+    air = scores.loc[("Lab", "AC", "action_on", "effect_airquality_up")]
+    assert air.loc["Window, 1", "support"] == 4
+    assert air.loc["Window, 1", "coverage"] == 1.0
+    assert air.loc["Window, 1", "confidence"] == 0.5
+    assert air.loc["AirQuality, 0", "support"] == 2
+    assert air.loc["AirQuality, 0", "confidence"] == 1.0
+    assert air.loc["AirPurifier, 0", "support"] == 0
+    assert air.loc["AirPurifier, 0", "confidence"] == 0.0
+    assert air.loc["HumanState, 1", "support"] == 0
+
+    # 没有回放实例的effect覆盖率为0
+    humidity = scores.loc[("Lab", "Humidifier", "action_on", "effect_humidity_up", "Humidity, 1")]
+    assert humidity["support"] == 0
+    assert humidity["coverage"] == 0.0
+
+
+def test_score_counterexamples_only(rule_index):
+    # 没有Occurred列时所有行都是反例
+    df = pd.DataFrame([
+        {"Space": "Corridor", "Device": "Speaker", "Action": "action_off", "Effect": "effect_noise_down",
+         "Context": {"Corridor": {"state": {"Noise": noise}}}, "LogRecords": []}
+        for noise in ("-1", "-1", "0")
+    ])
+    scores = rule_index.score(df).set_index(["space", "device", "action", "effect", "precondition"]).sort_index()
+    noise = scores.loc[("Corridor", "Speaker", "action_off", "effect_noise_down", "Noise, -1")]
+    assert noise["support"] == noise["failures"] == 2
+    assert noise["coverage"] == pytest.approx(2 / 3)
+
+
+def test_score_empty_log(rule_index):
+    df = pd.DataFrame(columns=["Space", "Device", "Action", "Effect", "Context", "Occurred"])
+    scores = rule_index.score(df)
+    assert len(scores) == len(rule_index.rules)
+    assert (scores["support"] == 0).all()
+    assert (scores["coverage"] == 0.0).all()
+    assert (scores["confidence"] == 0.0).all()